@@ -0,0 +1,117 @@
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+
+# Per-endpoint lanes. max_wait is how long a queued request waits for a slot (seconds).
+ENDPOINT_LIMITS = {
+    "/scan": {"max_concurrent": 2, "max_queue": 4, "max_wait": 20, "priority": "low"},
+    "/api/search_dish": {"max_concurrent": 4, "max_queue": 8, "max_wait": 15, "priority": "normal"},
+    "/api/barcode": {"max_concurrent": 8, "max_queue": 16, "max_wait": 10, "priority": "normal"},
+    "/chat": {"max_concurrent": 8, "max_queue": 16, "max_wait": 10, "priority": "high"},
+    "/meal_plan": {"max_concurrent": 8, "max_queue": 16, "max_wait": 5, "priority": "high"},
+}
+
+# Requests in flight across all lanes; lower priorities may only use part of it,
+# so cheap endpoints keep headroom while /scan is saturated
+GLOBAL_MAX_CONCURRENT = 12
+PRIORITY_SHARE = {"low": 0.5, "normal": 0.75, "high": 1.0}
+PRIORITY_RANK = {"low": 0, "normal": 1, "high": 2}
+
+class Overloaded(Exception):
+    """
+    Raised when a request is shed; status_code is 429 (queue full) or 503 (waited too long).
+    """
+    def __init__(self, message, status_code, retry_after):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class _Lane:
+    def __init__(self, name, max_concurrent, max_queue, max_wait, priority):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.priority = priority
+        self.in_flight = 0
+        self.waiting = 0
+        self.avg_seconds = 1.0  # moving average of service time, used for Retry-After
+
+class AdmissionController:
+    def __init__(self, endpoint_limits=ENDPOINT_LIMITS, global_max_concurrent=GLOBAL_MAX_CONCURRENT):
+        self.lanes = {path: _Lane(path, **cfg) for path, cfg in endpoint_limits.items()}
+        self.global_max = global_max_concurrent
+        self.in_flight = 0
+        self._cond = None  # created on first use so it binds to the server's event loop
+
+    def lane_for(self, path: str):
+        return self.lanes.get(path.rstrip("/") or "/")
+
+    def _global_cap(self, lane) -> int:
+        return max(1, math.ceil(self.global_max * PRIORITY_SHARE[lane.priority]))
+
+    def _can_run(self, lane) -> bool:
+        if lane.in_flight >= lane.max_concurrent or self.in_flight >= self._global_cap(lane):
+            return False
+        # Queued higher-priority requests that have room in their own lane go first
+        rank = PRIORITY_RANK[lane.priority]
+        return not any(
+            other.waiting and other.in_flight < other.max_concurrent
+            for other in self.lanes.values()
+            if PRIORITY_RANK[other.priority] > rank
+        )
+
+    def retry_after(self, lane) -> int:
+        return max(1, math.ceil(lane.avg_seconds * (lane.waiting + 1) / lane.max_concurrent))
+
+    def is_saturated(self, path: str) -> bool:
+        """
+        True when requests are queued behind this lane or it is at its share of
+        global capacity; endpoints use it to skip optional work.
+        """
+        lane = self.lane_for(path)
+        if lane is None:
+            return False
+        return lane.waiting > 0 or self.in_flight >= self._global_cap(lane)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "lanes": {
+                name: {"in_flight": lane.in_flight, "waiting": lane.waiting, "avg_seconds": round(lane.avg_seconds, 2)}
+                for name, lane in self.lanes.items()
+            },
+        }
+
+    @asynccontextmanager
+    async def admit(self, lane):
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        cond = self._cond
+
+        async with cond:
+            if not self._can_run(lane):
+                if lane.waiting >= lane.max_queue:
+                    raise Overloaded(f"{lane.name} is busy, please retry later", 429, self.retry_after(lane))
+                lane.waiting += 1
+                try:
+                    await asyncio.wait_for(cond.wait_for(lambda: self._can_run(lane)), lane.max_wait)
+                except asyncio.TimeoutError:
+                    cond.notify_all()
+                    raise Overloaded(f"{lane.name} is overloaded, please retry later", 503, self.retry_after(lane))
+                finally:
+                    lane.waiting -= 1
+            lane.in_flight += 1
+            self.in_flight += 1
+
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            async with cond:
+                lane.in_flight -= 1
+                self.in_flight -= 1
+                lane.avg_seconds = 0.8 * lane.avg_seconds + 0.2 * elapsed
+                cond.notify_all()
@@ -1,7 +1,7 @@
 import os
 import cohere
 from dotenv import load_dotenv
-from chatbot_prompt import get_chatbot_prompt
+from chatbot_prompt import get_chatbot_prompt, estimate_tokens
 from deepai_helper import get_deepai_completion
 import concurrent.futures
 
@@ -11,19 +11,34 @@ COHERE_API_KEY = os.getenv("COHERE_API_KEY")
 
 co = cohere.Client(COHERE_API_KEY)
 
-def ask_nutribot(question: str) -> str:
+def generate_reply(question: str, max_tokens: int = None) -> str:
+    """
+    Cohere reply with DeepAI as fallback; raises when neither produces one.
+    """
     try:
+        # max_tokens is only sent when set, so callers without a budget keep the API default
+        options = {"max_tokens": max_tokens} if max_tokens else {}
+        print(f"🧮 Chat prompt ~{estimate_tokens(question)} tokens, max_tokens={max_tokens}")
         response = co.chat(
             model="command-r-plus",
             message=question,
-            temperature=0.6
+            temperature=0.6,
+            **options
         )
         return response.text
     except Exception as e:
         print(f"❌ Cohere error: {e}")
         # Fallback to DeepAI
         deepai_output = get_deepai_completion(question)
-        return deepai_output or "Sorry, I couldn't generate a response at this time."
+        if not deepai_output:
+            raise RuntimeError(f"No chatbot reply from Cohere or DeepAI: {e}")
+        return deepai_output
+
+def ask_nutribot(question: str, max_tokens: int = None) -> str:
+    try:
+        return generate_reply(question, max_tokens)
+    except Exception:
+        return "Sorry, I couldn't generate a response at this time."
 
 def get_dynamic_health_context(nutrition: dict) -> dict:
     nutrition_lines = "\n".join([f"{k}: {v}" for k, v in nutrition.items()])
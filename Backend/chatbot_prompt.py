@@ -1,74 +1,233 @@
+import os
+import math
+from health_rules import nutrient_vector, evaluate, HEALTH_CONDITIONS, VERDICTS
+from dish_nutrition import NUTRIENT_KEYS
+
+# ---------------------- Templates ------------------------
+# Built once at import; the get_*_prompt functions only fill in the fields.
+
+GENERAL_NUTRITION_TEMPLATE = (
+    'You are "EatRight Assistant", a friendly, witty, and supportive diet and nutrition chatbot.\n'
+    "You always answer in a short, clear, and encouraging way.\n"
+    "You give responses based on the user’s profile (age, health conditions, dietary preferences) if available.\n"
+    "When giving calorie or nutrient info, always include a fun, relatable comparison (e.g., “That’s like 5 bananas 🍌”).\n"
+    "Avoid medical claims; instead, give educational, friendly advice."
+)
+
+SCAN_RESULT_TEMPLATE = (
+    "You are my food health guide. I just scanned this dish: {dish_name}.\n"
+    "Here’s the nutrition info: {nutrition_info}.\n"
+    "My health conditions: {health_conditions}.\n"
+    "My dietary preferences: {diet_preferences}.\n\n"
+    "Explain in 3–4 sentences:\n"
+    "1. Is it good for me? Why or why not?\n"
+    "2. Healthier ways to prepare it or eat it.\n"
+    "3. Any fun fact about the dish or ingredients."
+)
+
+SEARCH_DISH_TEMPLATE = (
+    "I searched for this dish: {dish_name}.\n"
+    "Here’s its nutrition: {nutrition_info}.\n"
+    "Given my health profile ({health_conditions}, {diet_preferences}),\n"
+    "give me:\n"
+    "1. A short verdict (“Good for you”, “Eat in moderation”, etc.).\n"
+    "2. 1–2 quick healthier alternatives.\n"
+    "3. A friendly closing tip in a fun tone."
+)
+
+MEAL_PLAN_TEMPLATE = (
+    "Create a {days}-day meal plan under {calorie_limit} calories per day.\n"
+    "Include breakfast, lunch, dinner, and 1 snack.\n"
+    "Make it suitable for: {diet_preferences}, with these health conditions: {health_conditions}.\n"
+    "Reply in a clear, bullet-point list with calorie counts per meal."
+)
+
+MEAL_PLAN_SUMMARY_TEMPLATE = (
+    "Here is my meal plan, already checked against my calorie limit:\n"
+    "{plan_text}\n"
+    "My dietary preferences: {diet_preferences}. My health conditions: {health_conditions}.\n"
+    "Present it as a friendly, clear bullet-point plan. Do not change the dishes or calorie counts; "
+    "add one short tip per day."
+)
+
+RECIPE_HELPER_TEMPLATE = (
+    "I want to make {dish_name}.\n"
+    "Suggest a step-by-step recipe.\n"
+    "For each step, add a healthier alternative if possible, keeping my profile in mind:\n"
+    "Health: {health_conditions}\n"
+    "Diet: {diet_preferences}."
+)
+
+FUN_FACT_TEMPLATE = (
+    "Tell me one surprising or fun health fact about {ingredient_name}, in 2–3 sentences, and make it engaging for a young audience."
+)
+
+# ---------------------- Token Budgets ------------------------
+
+# Tokens the model may generate per action; override with e.g. MAX_TOKENS_SCAN=250
+DEFAULT_MAX_TOKENS = {
+    "scan": 180,
+    "search": 160,
+    "meal_plan": 500,
+    "meal_plan_summary": 400,
+    "recipe": 450,
+    "fun_fact": 90,
+    "general": 250,
+    "health_context": 350,
+}
+
+# Upper bound on prompt tokens per call; long fields are trimmed to fit
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET") or 400)
+
+# Free-text fields that may be shortened when a prompt is over budget.
+# plan_text is structured data the model must reproduce, so it is never cut.
+TRIMMABLE_FIELDS = ("nutrition_info",)
+
+# Extra prompt tokens per planned day (format_meal_plan writes ~185 characters per day)
+PLAN_DAY_TOKENS = 60
+
+def get_max_tokens(action: str) -> int:
+    action = action if action in DEFAULT_MAX_TOKENS else "general"
+    return int(os.getenv(f"MAX_TOKENS_{action.upper()}") or DEFAULT_MAX_TOKENS[action])
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count (~4 characters per token for English text).
+    """
+    return math.ceil(len(text or "") / 4)
+
+def _render(template: str, fields: dict, budget: int = None) -> str:
+    budget = budget or PROMPT_TOKEN_BUDGET
+    prompt = template.format(**fields)
+    over = estimate_tokens(prompt) - budget
+    if over <= 0:
+        return prompt
+    for name in TRIMMABLE_FIELDS:
+        value = str(fields.get(name, ""))
+        if over <= 0 or not value:
+            continue
+        keep = max(0, len(value) - over * 4 - 3)
+        fields = {**fields, name: value[:keep].rstrip() + "..."}
+        prompt = template.format(**fields)
+        over = estimate_tokens(prompt) - budget
+    return prompt
+
+# ---------------------- Nutrition Serialization ------------------------
+
+_UNITS = {"Calories": "kcal", "Sodium": "mg", "Cholesterol": "mg", "Iron": "mg", "Calcium": "mg"}
+_SHORT_NAMES = {"Calories": "", "Fats": "fat"}
+
+def serialize_nutrition(nutrition: dict, quantity_g=None, max_tags=4) -> str:
+    """
+    Compact, canonical text for a nutrition dict, e.g.
+    "per 150g: 300kcal, protein 20g, fat 12g; tags: high protein; flags: high_BP not recommended".
+    Takes a flat nutrient dict or the /scan shape with per_100g/for_user_quantity
+    blocks and only sends one block. Flags come from health_rules.
+    """
+    nutrition = nutrition or {}
+    if "for_user_quantity" in nutrition or "per_100g" in nutrition:
+        if nutrition.get("for_user_quantity") and quantity_g:
+            amounts, basis = nutrition["for_user_quantity"], f"per {quantity_g:g}g"
+        else:
+            amounts, basis = nutrition.get("per_100g") or {}, "per 100g"
+    else:
+        amounts, basis = nutrition, f"per {quantity_g:g}g" if quantity_g else "per serving"
+
+    vec = nutrient_vector(amounts)
+    values = []
+    for key, value in zip(NUTRIENT_KEYS, vec):
+        if math.isnan(value):
+            continue
+        name = _SHORT_NAMES.get(key, key.lower())
+        value = f"{value:.0f}" if value >= 10 else f"{value:.1f}".rstrip("0").rstrip(".")
+        values.append(f"{name} {value}{_UNITS.get(key, 'g')}".strip())
+    if not values:
+        return "unknown"
+
+    parts = [f"{basis}: " + ", ".join(values)]
+    tags = nutrition.get("Health Tags") or nutrition.get("health_tags") or []
+    if isinstance(tags, list) and tags:
+        parts.append("tags: " + ", ".join(str(t) for t in tags[:max_tags]))
+    flags = [
+        f"{condition} {VERDICTS[level]}"
+        for condition, level in zip(HEALTH_CONDITIONS, evaluate(vec)[0])
+        if level
+    ]
+    if flags:
+        parts.append("flags: " + ", ".join(flags))
+    return "; ".join(parts)
+
+# ---------------------- Prompt Builders ------------------------
+
 def get_general_nutrition_prompt(user_profile=None):
     """
     System prompt for general nutrition Q&A.
     """
-    return (
-        'You are "EatRight Assistant", a friendly, witty, and supportive diet and nutrition chatbot.\n'
-        "You always answer in a short, clear, and encouraging way.\n"
-        "You give responses based on the user’s profile (age, health conditions, dietary preferences) if available.\n"
-        "When giving calorie or nutrient info, always include a fun, relatable comparison (e.g., “That’s like 5 bananas 🍌”).\n"
-        "Avoid medical claims; instead, give educational, friendly advice."
-    )
+    return GENERAL_NUTRITION_TEMPLATE
 
 def get_scan_result_prompt(dish_name, nutrition_info, health_conditions, diet_preferences):
     """
     Prompt for explaining scan results.
     """
-    return (
-        f"You are my food health guide. I just scanned this dish: {dish_name}.\n"
-        f"Here’s the nutrition info: {nutrition_info}.\n"
-        f"My health conditions: {health_conditions}.\n"
-        f"My dietary preferences: {diet_preferences}.\n\n"
-        "Explain in 3–4 sentences:\n"
-        "1. Is it good for me? Why or why not?\n"
-        "2. Healthier ways to prepare it or eat it.\n"
-        "3. Any fun fact about the dish or ingredients."
-    )
+    return _render(SCAN_RESULT_TEMPLATE, {
+        "dish_name": dish_name,
+        "nutrition_info": nutrition_info,
+        "health_conditions": health_conditions,
+        "diet_preferences": diet_preferences,
+    })
 
 def get_search_dish_prompt(dish_name, nutrition_info, health_conditions, diet_preferences):
     """
     Prompt for search dish advice.
     """
-    return (
-        f"I searched for this dish: {dish_name}.\n"
-        f"Here’s its nutrition: {nutrition_info}.\n"
-        f"Given my health profile ({health_conditions}, {diet_preferences}),\n"
-        "give me:\n"
-        "1. A short verdict (“Good for you”, “Eat in moderation”, etc.).\n"
-        "2. 1–2 quick healthier alternatives.\n"
-        "3. A friendly closing tip in a fun tone."
-    )
+    return _render(SEARCH_DISH_TEMPLATE, {
+        "dish_name": dish_name,
+        "nutrition_info": nutrition_info,
+        "health_conditions": health_conditions,
+        "diet_preferences": diet_preferences,
+    })
 
 def get_meal_plan_prompt(days, calorie_limit, diet_preferences, health_conditions):
     """
     Prompt for meal plan suggestion.
     """
-    return (
-        f"Create a {days}-day meal plan under {calorie_limit} calories per day.\n"
-        "Include breakfast, lunch, dinner, and 1 snack.\n"
-        f"Make it suitable for: {diet_preferences}, with these health conditions: {health_conditions}.\n"
-        "Reply in a clear, bullet-point list with calorie counts per meal."
-    )
+    return _render(MEAL_PLAN_TEMPLATE, {
+        "days": days,
+        "calorie_limit": calorie_limit,
+        "diet_preferences": diet_preferences,
+        "health_conditions": health_conditions,
+    })
+
+def get_meal_plan_summary_prompt(plan_text, diet_preferences, health_conditions, days=1):
+    """
+    Prompt for phrasing a meal plan that was already computed locally.
+    Raises ValueError when the plan does not fit the budget for its length.
+    """
+    budget = PROMPT_TOKEN_BUDGET + PLAN_DAY_TOKENS * days
+    prompt = _render(MEAL_PLAN_SUMMARY_TEMPLATE, {
+        "plan_text": plan_text,
+        "diet_preferences": diet_preferences,
+        "health_conditions": health_conditions,
+    }, budget=budget)
+    if estimate_tokens(prompt) > budget:
+        raise ValueError(f"Meal plan is too long to explain ({estimate_tokens(prompt)} > {budget} prompt tokens)")
+    return prompt
 
 def get_recipe_helper_prompt(dish_name, health_conditions, diet_preferences):
     """
     Prompt for recipe helper.
     """
-    return (
-        f"I want to make {dish_name}.\n"
-        "Suggest a step-by-step recipe.\n"
-        "For each step, add a healthier alternative if possible, keeping my profile in mind:\n"
-        f"Health: {health_conditions}\n"
-        f"Diet: {diet_preferences}."
-    )
+    return _render(RECIPE_HELPER_TEMPLATE, {
+        "dish_name": dish_name,
+        "health_conditions": health_conditions,
+        "diet_preferences": diet_preferences,
+    })
 
 def get_fun_fact_prompt(ingredient_name):
     """
     Prompt for a fun health fact.
     """
-    return (
-        f"Tell me one surprising or fun health fact about {ingredient_name}, in 2–3 sentences, and make it engaging for a young audience."
-    )
+    return _render(FUN_FACT_TEMPLATE, {"ingredient_name": ingredient_name})
 
 def get_chatbot_prompt(action, **kwargs):
     """
@@ -95,6 +254,13 @@ def get_chatbot_prompt(action, **kwargs):
             diet_preferences=kwargs.get("diet_preferences", ""),
             health_conditions=kwargs.get("health_conditions", "")
         )
+    elif action == "meal_plan_summary":
+        return get_meal_plan_summary_prompt(
+            plan_text=kwargs.get("plan_text", ""),
+            diet_preferences=kwargs.get("diet_preferences", ""),
+            health_conditions=kwargs.get("health_conditions", ""),
+            days=kwargs.get("days", 1)
+        )
     elif action == "recipe":
         return get_recipe_helper_prompt(
             dish_name=kwargs.get("dish_name", ""),
@@ -106,4 +272,4 @@ def get_chatbot_prompt(action, **kwargs):
             ingredient_name=kwargs.get("ingredient_name", "")
         )
     else:
-        return get_general_nutrition_prompt(user_profile=kwargs.get("user_profile", None))
\ No newline at end of file
+        return get_general_nutrition_prompt(user_profile=kwargs.get("user_profile", None))
@@ -5,44 +5,47 @@ import re
 import concurrent.futures
 from dotenv import load_dotenv
 from deepai_helper import get_deepai_completion
+from chatbot_prompt import get_max_tokens, estimate_tokens
 load_dotenv()
 
 COHERE_API_KEY = os.getenv("COHERE_API_KEY")
 co = cohere.Client(COHERE_API_KEY)
 
+# Templates are built once; only the nutrition data / dish name is filled in per call
+HEALTH_CONTEXT_FIELDS = (
+    '1. "health_tags": list of 3–6 tags such as "high protein", "low fat", "iron-rich".\n'
+    '2. "healthier_substitute": one practical suggestion to make the dish healthier.\n'
+)
+
+HEALTH_CONTEXT_FROM_NUTRITION_TEMPLATE = (
+    "You are a health-focused nutrition expert. Given the nutrition data of a non-vegetarian dish per 100g, return JSON with:\n"
+    + HEALTH_CONTEXT_FIELDS
+    + "Nutrition data: {nutrition_json}\n"
+    "Respond only in JSON."
+)
+
+HEALTH_CONTEXT_FROM_DISH_TEMPLATE = (
+    "You are a health-focused nutrition expert. Given the name of a non-vegetarian dish, estimate its typical nutrition and return JSON with:\n"
+    + HEALTH_CONTEXT_FIELDS
+    + '3. "estimated_nutrition": object with numeric calories, protein, fat, carbs, fiber, iron, sodium, cholesterol per 100g.\n'
+    'Dish name: "{dish_name}"\n'
+    "Respond only in JSON."
+)
+
 def get_dynamic_health_context(nutrition_data: dict = None, dish_name: str = None, timeout=15):
     try:
         if nutrition_data and len(nutrition_data) > 0:
             # Remove None values and convert to floats
             safe_nutrition_data = {k: float(v) for k, v in nutrition_data.items() if v is not None}
-            prompt = f"""
-You are a health-focused nutrition expert. Given the nutrition data of a non-vegetarian dish per 100g, analyze and return the following fields in proper JSON:
-
-1. "health_tags": A list of 3–6 tags such as "high protein", "low fat", "iron-rich", etc.
-2. "suitability": A dictionary with health conditions as keys (heart_disease, high_BP, low_BP, diabetes, high_cholesterol, kidney) and 1-line advice.
-3. "healthier_substitute": One practical suggestion to make the dish healthier.
-
-Here is the nutrition data:
-{json.dumps(safe_nutrition_data, indent=2)}
-
-Respond only in JSON.
-"""
+            prompt = HEALTH_CONTEXT_FROM_NUTRITION_TEMPLATE.format(
+                nutrition_json=json.dumps(safe_nutrition_data, separators=(",", ":"))
+            )
         elif dish_name:
-            prompt = f"""
-You are a health-focused nutrition expert. Given the name of a non-vegetarian dish, estimate its typical nutrition profile and return the following fields in proper JSON:
-
-1. "health_tags": A list of 3–6 tags such as "high protein", "low fat", "iron-rich", etc.
-2. "suitability": A dictionary with health conditions as keys (heart_disease, high_BP, low_BP, diabetes, high_cholesterol, kidney) and 1-line advice.
-3. "healthier_substitute": One practical suggestion to make the dish healthier.
-4. "estimated_nutrition": A dictionary with estimated values for calories, protein, fat, carbs, fiber, iron, sodium, cholesterol, etc. (per 100g).
-
-Dish name: "{dish_name}"
-
-Respond only in JSON.
-"""
+            prompt = HEALTH_CONTEXT_FROM_DISH_TEMPLATE.format(dish_name=dish_name)
         else:
             raise ValueError("Either nutrition_data or dish_name must be provided.")
 
+        print(f"🧮 Health context prompt ~{estimate_tokens(prompt)} tokens")
         response = call_cohere_api(prompt)
         
         text = response.generations[0].text.strip()
@@ -86,7 +89,6 @@ Respond only in JSON.
             return {
                 "estimated_nutrition": data.get("estimated_nutrition", {}),
                 "health_tags": data.get("health_tags", []),
-                "suitability": data.get("suitability", {}),
                 "healthier_substitute": data.get("healthier_substitute", "N/A"),
                 "source": "DeepAI",
                 "raw_output": deepai_output
@@ -96,17 +98,16 @@ Respond only in JSON.
             return {
                 "estimated_nutrition": {},  # Parse from deepai_output if possible
                 "health_tags": [],
-                "suitability": {},
                 "healthier_substitute": "N/A",
                 "source": "DeepAI",
                 "raw_output": deepai_output
             }
 
-def call_cohere_api(prompt):
+def call_cohere_api(prompt, max_tokens=None):
     response = co.generate(
         model="command-r-plus",
         prompt=prompt,
         temperature=0.4,
-        max_tokens=350
+        max_tokens=max_tokens or get_max_tokens("health_context")
     )
     return response
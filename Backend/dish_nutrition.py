@@ -0,0 +1,41 @@
+import os
+import re
+import json
+
+# Per-100g nutrient table for every class in label_map.json. Entries with no meal slots
+# (the merged model class "chicken_tikka_masalachicken_65") are for scan lookups only:
+# the meal planner and substitutes never suggest them.
+DISH_NUTRITION_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dish_nutrition.json")
+
+NUTRIENT_KEYS = ["Calories", "Protein", "Fats", "Carbs", "Fiber", "Sugar", "Cholesterol", "Sodium", "Iron", "Calcium"]
+
+with open(DISH_NUTRITION_PATH, "r") as f:
+    DISH_TABLE = json.load(f)
+
+def normalize_dish_name(name: str) -> str:
+    """
+    Folds model labels ("Lamb_Rogan_Josh_(Kashmiri)"), cleaned labels
+    ("butter chicken") and user input onto one lookup key.
+    """
+    return re.sub(r"[^a-z0-9]+", " ", (name or "").lower()).strip()
+
+_DISH_INDEX = {normalize_dish_name(label): label for label in DISH_TABLE}
+
+def find_dish(name: str):
+    """
+    Returns (label, entry) for a known dish, or (None, None).
+    """
+    label = _DISH_INDEX.get(normalize_dish_name(name))
+    if label is None:
+        return None, None
+    return label, DISH_TABLE[label]
+
+def display_name(label: str) -> str:
+    return label.replace("_", " ").replace("(", "").replace(")", "").strip()
+
+def per_serving(entry: dict) -> dict:
+    """
+    Scales the per-100g nutrients of a table entry to its typical serving.
+    """
+    factor = entry["serving_g"] / 100.0
+    return {k: round(v * factor, 2) for k, v in entry["per_100g"].items()}
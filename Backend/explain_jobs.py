@@ -0,0 +1,186 @@
+import os
+import time
+import uuid
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from chatbot import generate_reply
+
+# "memory" keeps jobs in this process; "sqlite" shares them between uvicorn workers on one host
+JOB_BACKEND = os.getenv("EXPLAIN_JOB_BACKEND") or "memory"
+JOB_DB_PATH = os.getenv("EXPLAIN_JOB_DB_PATH") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "explain_jobs.db")
+JOB_TTL_SECONDS = int(os.getenv("EXPLAIN_JOB_TTL") or 600)
+EXPLAIN_WORKERS = int(os.getenv("EXPLAIN_WORKERS") or 4)
+MAX_PENDING_JOBS = int(os.getenv("EXPLAIN_MAX_PENDING") or 100)
+
+class JobQueueFull(Exception):
+    pass
+
+def prompt_key(prompt: str, max_tokens=None) -> str:
+    return hashlib.sha256(f"{max_tokens}|{prompt}".encode("utf-8")).hexdigest()
+
+class MemoryJobStore:
+    def __init__(self, ttl=JOB_TTL_SECONDS):
+        self.ttl = ttl
+        self._jobs = {}
+        self._by_key = {}
+        self._lock = threading.Lock()
+
+    def _purge(self, now):
+        for job_id in [j for j, job in self._jobs.items() if job["expires_at"] <= now]:
+            job = self._jobs.pop(job_id)
+            if self._by_key.get(job["prompt_key"]) == job_id:
+                del self._by_key[job["prompt_key"]]
+
+    def create_or_get(self, key):
+        """
+        Returns (job_id, created). An unexpired job for the same prompt is reused
+        unless it failed.
+        """
+        now = time.time()
+        with self._lock:
+            self._purge(now)
+            job_id = self._by_key.get(key)
+            if job_id and self._jobs[job_id]["status"] != "failed":
+                return job_id, False
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                "job_id": job_id,
+                "prompt_key": key,
+                "status": "pending",
+                "result": None,
+                "error": None,
+                "created_at": now,
+                "expires_at": now + self.ttl,
+            }
+            self._by_key[key] = job_id
+            return job_id, True
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                job.update(fields)
+                if fields.get("status") in ("done", "failed"):
+                    job["expires_at"] = time.time() + self.ttl
+
+    def get(self, job_id):
+        with self._lock:
+            self._purge(time.time())
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+class SQLiteJobStore:
+    """
+    Same interface as MemoryJobStore, backed by a local SQLite file so every
+    worker process sees the same jobs and deduplicates against them.
+    """
+    def __init__(self, path=JOB_DB_PATH, ttl=JOB_TTL_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id TEXT PRIMARY KEY, prompt_key TEXT NOT NULL UNIQUE, status TEXT NOT NULL, "
+                "result TEXT, error TEXT, created_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_expires ON jobs (expires_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def create_or_get(self, key):
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM jobs WHERE expires_at <= ?", (now,))
+            row = conn.execute("SELECT job_id, status FROM jobs WHERE prompt_key = ?", (key,)).fetchone()
+            if row and row["status"] != "failed":
+                conn.execute("COMMIT")
+                return row["job_id"], False
+            conn.execute("DELETE FROM jobs WHERE prompt_key = ?", (key,))
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO jobs (job_id, prompt_key, status, created_at, expires_at) VALUES (?, ?, 'pending', ?, ?)",
+                (job_id, key, now, now + self.ttl)
+            )
+            conn.execute("COMMIT")
+            return job_id, True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def update(self, job_id, **fields):
+        if fields.get("status") in ("done", "failed"):
+            fields["expires_at"] = time.time() + self.ttl
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self._connect().execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", list(fields.values()) + [job_id])
+
+    def get(self, job_id):
+        row = self._connect().execute(
+            "SELECT * FROM jobs WHERE job_id = ? AND expires_at > ?", (job_id, time.time())
+        ).fetchone()
+        return dict(row) if row else None
+
+store = SQLiteJobStore() if JOB_BACKEND == "sqlite" else MemoryJobStore()
+
+_executor = ThreadPoolExecutor(max_workers=EXPLAIN_WORKERS, thread_name_prefix="explain")
+_pending = 0
+_pending_lock = threading.Lock()
+
+def _run(job_id, prompt, max_tokens):
+    global _pending
+    try:
+        store.update(job_id, status="running")
+        # generate_reply raises instead of returning ask_nutribot's apology, so a
+        # failed generation is stored as failed (and retried) rather than cached
+        reply = generate_reply(prompt, max_tokens)
+        store.update(job_id, status="done", result=reply)
+    except Exception as e:
+        print(f"❌ Explanation job {job_id} failed: {e}")
+        store.update(job_id, status="failed", error=str(e))
+    finally:
+        with _pending_lock:
+            _pending -= 1
+
+def submit_explanation(prompt: str, max_tokens: int = None) -> str:
+    """
+    Queues a chatbot reply and returns its job id. Identical prompts
+    share one job while it is pending, running or cached.
+    """
+    global _pending
+    job_id, created = store.create_or_get(prompt_key(prompt, max_tokens))
+    if not created:
+        return job_id
+    with _pending_lock:
+        if _pending >= MAX_PENDING_JOBS:
+            store.update(job_id, status="failed", error="Explanation queue is full")
+            raise JobQueueFull("Explanation queue is full")
+        _pending += 1
+    _executor.submit(_run, job_id, prompt, max_tokens)
+    return job_id
+
+def get_job(job_id: str):
+    """
+    Public view of a job: id, status (pending/running/done/failed), result and error.
+    """
+    job = store.get(job_id)
+    if job is None:
+        return None
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "result": job["result"],
+        "error": job["error"],
+        "expires_in": max(0, round(job["expires_at"] - time.time())),
+    }
@@ -0,0 +1,265 @@
+"""
+Local FoodData Central index.
+
+Imports a USDA FoodData Central bulk download into one SQLite file with an
+FTS5 name index and a GTIN/UPC index, so dish and barcode lookups resolve
+locally instead of the search + details round trips in try_usda.
+
+    python fdc_index.py import path/to/FoodData_Central_csv_2024-10-31/
+    python fdc_index.py import path/to/FoodData_Central_sr_legacy_food_json.json
+    python fdc_index.py search "chicken curry"
+    python fdc_index.py barcode 041196910759
+"""
+import os
+import re
+import csv
+import sys
+import json
+import sqlite3
+import argparse
+import threading
+from dish_nutrition import NUTRIENT_KEYS
+
+INDEX_PATH = os.getenv("FDC_INDEX_PATH") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "fdc_index.db")
+
+# FDC nutrient ids -> our nutrient keys (all per 100g in the bulk data)
+NUTRIENT_IDS = {
+    1008: "Calories",     # Energy (kcal)
+    2047: "Calories",     # Energy (Atwater General Factors), Foundation foods
+    1003: "Protein",
+    1004: "Fats",         # Total lipid (fat)
+    1005: "Carbs",        # Carbohydrate, by difference
+    1079: "Fiber",
+    2000: "Sugar",        # Sugars, total including NLEA
+    1063: "Sugar",        # Sugars, Total
+    1253: "Cholesterol",
+    1093: "Sodium",
+    1089: "Iron",
+    1087: "Calcium",
+}
+_COLUMNS = [n.lower() for n in NUTRIENT_KEYS]
+
+# Generic reference foods rank above branded products for dish-name searches
+DATA_TYPE_RANK = {"foundation_food": 0, "sr_legacy_food": 1, "survey_fndds_food": 2, "branded_food": 3}
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS foods (
+    fdc_id INTEGER PRIMARY KEY,
+    description TEXT NOT NULL,
+    data_type TEXT,
+    type_rank INTEGER NOT NULL DEFAULT 9,
+    brand TEXT,
+    gtin TEXT,
+    {", ".join(f"{c} REAL" for c in _COLUMNS)}
+);
+CREATE INDEX IF NOT EXISTS foods_gtin ON foods (gtin);
+CREATE VIRTUAL TABLE IF NOT EXISTS foods_fts USING fts5(
+    description, content='foods', content_rowid='fdc_id', tokenize='unicode61 remove_diacritics 2'
+);
+"""
+
+# dataType values in the JSON releases -> data_type values in the CSV release
+JSON_DATA_TYPES = {
+    "Foundation": "foundation_food",
+    "SR Legacy": "sr_legacy_food",
+    "Survey (FNDDS)": "survey_fndds_food",
+    "Branded": "branded_food",
+}
+
+BATCH_SIZE = 50_000
+
+_local = threading.local()
+
+def normalize_gtin(code) -> str:
+    """
+    Digits only, without leading zeros, so UPC-A, EAN-13 and GTIN-14 forms of one code match.
+    """
+    return re.sub(r"\D", "", str(code or "")).lstrip("0")
+
+def _connect(path=None, readonly=True):
+    path = path or INDEX_PATH
+    if readonly:
+        conn = getattr(_local, "conn", None)
+        if conn is not None and _local.path == path:
+            return conn
+        if not os.path.exists(path):
+            return None
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        _local.conn, _local.path = conn, path
+        return conn
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    return conn
+
+# ---------------------- Import ------------------------
+
+def _set_nutrients(conn, rows):
+    """
+    rows: (column, value, fdc_id); the first value seen for a column wins
+    (e.g. when a food has both Energy and Atwater energy).
+    """
+    by_column = {}
+    for column, value, fdc_id in rows:
+        by_column.setdefault(column, []).append((value, fdc_id))
+    for column, params in by_column.items():
+        conn.executemany(f"UPDATE foods SET {column} = ? WHERE fdc_id = ? AND {column} IS NULL", params)
+
+def import_csv_dir(directory, path=None):
+    """
+    Imports the CSV release (food.csv, food_nutrient.csv, optional branded_food.csv).
+    food_nutrient.csv is streamed and only the nutrients above are kept.
+    """
+    conn = _connect(path, readonly=False)
+    count = 0
+    with conn:
+        with open(os.path.join(directory, "food.csv"), newline="", encoding="utf-8") as f:
+            batch = []
+            for row in csv.DictReader(f):
+                data_type = row.get("data_type", "")
+                batch.append((int(row["fdc_id"]), row["description"], data_type, DATA_TYPE_RANK.get(data_type, 9)))
+                if len(batch) >= BATCH_SIZE:
+                    conn.executemany("INSERT OR REPLACE INTO foods (fdc_id, description, data_type, type_rank) VALUES (?, ?, ?, ?)", batch)
+                    count += len(batch)
+                    batch = []
+            conn.executemany("INSERT OR REPLACE INTO foods (fdc_id, description, data_type, type_rank) VALUES (?, ?, ?, ?)", batch)
+            count += len(batch)
+        print(f"📦 Imported {count} foods")
+
+        branded_path = os.path.join(directory, "branded_food.csv")
+        if os.path.exists(branded_path):
+            with open(branded_path, newline="", encoding="utf-8") as f:
+                batch = []
+                for row in csv.DictReader(f):
+                    batch.append((row.get("brand_owner") or row.get("brand_name"), normalize_gtin(row.get("gtin_upc")) or None, int(row["fdc_id"])))
+                    if len(batch) >= BATCH_SIZE:
+                        conn.executemany("UPDATE foods SET brand = ?, gtin = ? WHERE fdc_id = ?", batch)
+                        batch = []
+                conn.executemany("UPDATE foods SET brand = ?, gtin = ? WHERE fdc_id = ?", batch)
+            print("🏷️ Imported branded GTIN/UPC codes")
+
+        wanted = {str(k): v.lower() for k, v in NUTRIENT_IDS.items()}
+        with open(os.path.join(directory, "food_nutrient.csv"), newline="", encoding="utf-8") as f:
+            batch = []
+            for row in csv.DictReader(f):
+                column = wanted.get(row["nutrient_id"])
+                if column is None or not row.get("amount"):
+                    continue
+                batch.append((column, float(row["amount"]), int(row["fdc_id"])))
+                if len(batch) >= BATCH_SIZE:
+                    _set_nutrients(conn, batch)
+                    batch = []
+            _set_nutrients(conn, batch)
+        print("🧪 Imported nutrients")
+
+        conn.execute("INSERT INTO foods_fts (foods_fts) VALUES ('rebuild')")
+    conn.execute("PRAGMA optimize")
+    conn.close()
+    return count
+
+def import_json(json_path, path=None):
+    """
+    Imports a JSON release (SR Legacy, Foundation, Survey or Branded). The
+    file is loaded whole, so prefer the CSV release for the full branded set.
+    """
+    with open(json_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    foods = next((v for v in data.values() if isinstance(v, list)), []) if isinstance(data, dict) else data
+
+    conn = _connect(path, readonly=False)
+    with conn:
+        batch = []
+        for food in foods:
+            data_type = JSON_DATA_TYPES.get(food.get("dataType"), food.get("dataType"))
+            nutrients = {}
+            for item in food.get("foodNutrients", []):
+                nutrient_id = (item.get("nutrient") or {}).get("id") or item.get("nutrientId")
+                key = NUTRIENT_IDS.get(nutrient_id)
+                if key and key not in nutrients and item.get("amount") is not None:
+                    nutrients[key] = float(item["amount"])
+            batch.append(
+                [food["fdcId"], food.get("description", ""), data_type, DATA_TYPE_RANK.get(data_type, 9),
+                 food.get("brandOwner") or food.get("brandName"), normalize_gtin(food.get("gtinUpc")) or None]
+                + [nutrients.get(n) for n in NUTRIENT_KEYS]
+            )
+        conn.executemany(
+            f"INSERT OR REPLACE INTO foods (fdc_id, description, data_type, type_rank, brand, gtin, {', '.join(_COLUMNS)}) "
+            f"VALUES ({', '.join('?' for _ in range(6 + len(_COLUMNS)))})",
+            batch
+        )
+        conn.execute("INSERT INTO foods_fts (foods_fts) VALUES ('rebuild')")
+    conn.close()
+    print(f"📦 Imported {len(batch)} foods from {os.path.basename(json_path)}")
+    return len(batch)
+
+# ---------------------- Lookup ------------------------
+
+def _to_result(row) -> dict:
+    # Nutrients FDC has no value for are left out, not zeroed; health_rules treats them as unknown
+    result = {n: row[c] for n, c in zip(NUTRIENT_KEYS, _COLUMNS) if row[c] is not None}
+    result.update({
+        "fdc_id": row["fdc_id"],
+        "description": row["description"],
+        "brand": row["brand"],
+        "source": "USDA (local)",
+    })
+    return result
+
+def search_foods(name: str, limit: int = 5) -> list:
+    """
+    Full-text search on food descriptions; every word must match (prefix match on the last).
+    """
+    conn = _connect()
+    tokens = re.findall(r"\w+", (name or "").lower())
+    if conn is None or not tokens:
+        return []
+    query = " ".join(f'"{t}"' for t in tokens[:-1]) + f' "{tokens[-1]}"*'
+    rows = conn.execute(
+        "SELECT foods.* FROM foods_fts JOIN foods ON foods.fdc_id = foods_fts.rowid "
+        "WHERE foods_fts MATCH ? AND foods.calories IS NOT NULL "
+        "ORDER BY foods.type_rank, bm25(foods_fts) LIMIT ?",
+        (query.strip(), limit)
+    ).fetchall()
+    return [_to_result(row) for row in rows]
+
+def lookup_dish(name: str):
+    """
+    Best local match for a dish name, in try_usda's format, or None.
+    """
+    results = search_foods(name, limit=1)
+    return results[0] if results else None
+
+def lookup_barcode(code):
+    conn = _connect()
+    gtin = normalize_gtin(code)
+    if conn is None or not gtin:
+        return None
+    row = conn.execute("SELECT * FROM foods WHERE gtin = ? LIMIT 1", (gtin,)).fetchone()
+    return _to_result(row) if row else None
+
+def index_available() -> bool:
+    return _connect() is not None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and query the local FoodData Central index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_import = sub.add_parser("import", help="Import a CSV release directory or a JSON file")
+    p_import.add_argument("source")
+    p_search = sub.add_parser("search")
+    p_search.add_argument("name")
+    p_barcode = sub.add_parser("barcode")
+    p_barcode.add_argument("code")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        if os.path.isdir(args.source):
+            import_csv_dir(args.source)
+        else:
+            import_json(args.source)
+    elif args.command == "search":
+        print(json.dumps(search_foods(args.name), indent=2))
+    else:
+        result = lookup_barcode(args.code)
+        print(json.dumps(result, indent=2) if result else "Not found")
+        sys.exit(0 if result else 1)
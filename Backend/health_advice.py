@@ -1,15 +1,40 @@
-def get_health_verdict(dish_name: str, nutrition: dict):
-    verdict = {}
+from health_rules import evaluate_suitability
+from dish_nutrition import find_dish, per_serving
+from substitutes import best_substitute
+
+def get_suitability(dish_name: str, nutrition: dict):
+    """
+    Rule-engine suitability per condition, the single source for API responses.
+    """
+    # /scan passes {"per_100g": ..., "for_user_quantity": ...}; a flat nutrient dict works too
+    if "for_user_quantity" in nutrition or "per_100g" in nutrition:
+        amounts = nutrition.get("for_user_quantity") or nutrition.get("per_100g")
+    else:
+        amounts = nutrition
+    if not amounts:
+        label, entry = find_dish(dish_name)
+        amounts = per_serving(entry) if entry else {}
+    return evaluate_suitability(amounts)
 
-    fats = float(nutrition.get("Fats", 0))
-    sodium = float(nutrition.get("Sodium", 0))
-    calories = float(nutrition.get("Calories", 0))
+def pick_substitute(dish_name: str, suitability: dict, health_conditions="", default=None):
+    """
+    One substitute per request: keyed on the user's conditions when known,
+    else on the conditions this dish is flagged for.
+    """
+    flagged = [condition for condition, level in suitability.items() if level != "acceptable"]
+    return best_substitute(dish_name, health_conditions or flagged, default=default)
+
+def get_health_verdict(dish_name: str, nutrition: dict, substitute: str = None):
+    verdict = {}
 
-    dish_lower = dish_name.lower()
+    suitability = get_suitability(dish_name, nutrition)
+    flagged = [condition for condition, level in suitability.items() if level != "acceptable"]
+    verdict["suitability"] = suitability
 
-    if "biryani" in dish_lower or fats > 12 or sodium > 500:
-        verdict["warning"] = "⚠️ High cholesterol: Avoid biryanis or oily dishes"
-        verdict["suggested"] = "✅ Suggested Alternative: Grilled chicken with steamed rice"
+    if flagged:
+        verdict["warning"] = "⚠️ Take care if you have: " + ", ".join(c.replace("_", " ") for c in flagged)
+        substitute = substitute or pick_substitute(dish_name, suitability, default="Grilled chicken with steamed rice")
+        verdict["suggested"] = f"✅ Suggested Alternative: {substitute}"
     else:
         verdict["warning"] = "👍 This dish seems okay in moderation."
         verdict["suggested"] = "Try grilled or steamed versions for best health."
@@ -0,0 +1,150 @@
+import re
+from functools import lru_cache
+import numpy as np
+from dish_nutrition import DISH_TABLE, NUTRIENT_KEYS, per_serving
+
+HEALTH_CONDITIONS = ["diabetes", "heart_disease", "high_BP", "low_BP", "high_cholesterol", "kidney"]
+
+# Verdicts in increasing severity; a condition takes the worst verdict of its triggered rules
+VERDICTS = ["acceptable", "caution", "not recommended", "avoid"]
+
+# (condition, nutrient, operator, threshold, verdict), thresholds are for the amount evaluated
+# (one serving / the user's quantity). The first five match the original try_edamam checks.
+# The rest are new: try_edamam always returned "caution" for kidney and "acceptable" for
+# low_BP, which now depend on these thresholds, and cholesterol/sodium add to
+# high_cholesterol/heart_disease.
+RULES = [
+    ("diabetes", "Sugar", ">", 15, "avoid"),
+    ("diabetes", "Carbs", ">", 50, "avoid"),
+    ("high_BP", "Sodium", ">", 800, "not recommended"),
+    ("heart_disease", "Fats", ">", 30, "caution"),
+    ("high_cholesterol", "Fats", ">", 25, "not recommended"),
+    ("high_cholesterol", "Cholesterol", ">", 300, "caution"),
+    ("heart_disease", "Sodium", ">", 1000, "caution"),
+    ("low_BP", "Carbs", ">", 75, "caution"),
+    ("kidney", "Protein", ">", 35, "caution"),
+    ("kidney", "Sodium", ">", 700, "caution"),
+]
+
+CONDITION_ALIASES = {
+    "diabetic": "diabetes",
+    "high bp": "high_BP",
+    "hypertension": "high_BP",
+    "low bp": "low_BP",
+    "heart": "heart_disease",
+    "cholesterol": "high_cholesterol",
+    "kidney disease": "kidney",
+}
+
+# Lower-case keys seen in Edamam/USDA/Cohere output -> NUTRIENT_KEYS
+NUTRIENT_ALIASES = {
+    "calories": "Calories", "energy": "Calories", "kcal": "Calories",
+    "protein": "Protein",
+    "fat": "Fats", "fats": "Fats", "total_fat": "Fats", "total fat": "Fats",
+    "carbs": "Carbs", "carbohydrates": "Carbs", "carbohydrate": "Carbs",
+    "fiber": "Fiber", "fibre": "Fiber",
+    "sugar": "Sugar", "sugars": "Sugar",
+    "cholesterol": "Cholesterol",
+    "sodium": "Sodium",
+    "iron": "Iron",
+    "calcium": "Calcium",
+}
+
+_NUTRIENT_POS = {k: i for i, k in enumerate(NUTRIENT_KEYS)}
+_CANONICAL_CONDITIONS = {c.lower(): c for c in HEALTH_CONDITIONS}
+
+# Rule table compiled to columns so a whole nutrient matrix is checked in one pass
+_RULE_NUTRIENT = np.array([_NUTRIENT_POS[r[1]] for r in RULES])
+_RULE_THRESHOLD = np.array([r[3] for r in RULES], dtype=float)
+_RULE_IS_GT = np.array([r[2] == ">" for r in RULES])
+_RULE_SEVERITY = np.array([VERDICTS.index(r[4]) for r in RULES])
+_RULE_CONDITION = np.array([HEALTH_CONDITIONS.index(r[0]) for r in RULES])
+
+def parse_health_conditions(health_conditions):
+    """
+    Accepts a list or a comma-separated string and returns canonical
+    condition keys ("high bp" -> "high_BP").
+    """
+    if not health_conditions:
+        return []
+    if isinstance(health_conditions, str):
+        health_conditions = health_conditions.split(",")
+    conditions = []
+    for raw in health_conditions:
+        key = (raw or "").strip().lower().replace("_", " ")
+        if not key:
+            continue
+        key = CONDITION_ALIASES.get(key, key.replace(" ", "_"))
+        key = _CANONICAL_CONDITIONS.get(key.lower(), key)
+        if key not in conditions:
+            conditions.append(key)
+    return conditions
+
+def _to_float(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, dict):
+        value = value.get("quantity", value.get("value"))
+        return _to_float(value) if value is not None else np.nan
+    match = re.search(r"-?\d+(\.\d+)?", str(value))
+    return float(match.group()) if match else np.nan
+
+def nutrient_vector(nutrition: dict) -> np.ndarray:
+    """
+    Maps a nutrition dict with any of the key spellings above onto a
+    NUTRIENT_KEYS-ordered vector. Missing values are NaN and never trigger a rule.
+    """
+    vec = np.full(len(NUTRIENT_KEYS), np.nan)
+    for key, value in (nutrition or {}).items():
+        name = key if key in _NUTRIENT_POS else NUTRIENT_ALIASES.get(str(key).strip().lower())
+        if name is not None and value is not None:
+            vec[_NUTRIENT_POS[name]] = _to_float(value)
+    return vec
+
+def nutrient_matrix(nutrition_list) -> np.ndarray:
+    if not nutrition_list:
+        return np.empty((0, len(NUTRIENT_KEYS)))
+    return np.vstack([nutrient_vector(n) for n in nutrition_list])
+
+def evaluate(matrix: np.ndarray) -> np.ndarray:
+    """
+    Returns an (n_dishes, len(HEALTH_CONDITIONS)) array of indices into VERDICTS.
+    """
+    matrix = np.atleast_2d(matrix)
+    values = matrix[:, _RULE_NUTRIENT]
+    with np.errstate(invalid="ignore"):
+        triggered = np.where(_RULE_IS_GT, values > _RULE_THRESHOLD, values < _RULE_THRESHOLD)
+    severity = np.where(triggered, _RULE_SEVERITY, 0)
+    result = np.zeros((matrix.shape[0], len(HEALTH_CONDITIONS)), dtype=int)
+    np.maximum.at(result, (slice(None), _RULE_CONDITION), severity)
+    return result
+
+def _to_verdicts(row) -> dict:
+    return {condition: VERDICTS[s] for condition, s in zip(HEALTH_CONDITIONS, row)}
+
+def evaluate_suitability(nutrition: dict) -> dict:
+    """
+    Suitability verdict for every condition, e.g. {"diabetes": "avoid", ...}.
+    """
+    return _to_verdicts(evaluate(nutrient_vector(nutrition))[0])
+
+def evaluate_suitability_bulk(nutrition_list) -> list:
+    return [_to_verdicts(row) for row in evaluate(nutrient_matrix(nutrition_list))]
+
+@lru_cache(maxsize=1)
+def dish_table_matrix():
+    """
+    (labels, per-serving nutrient matrix, verdict matrix) for every known dish.
+    """
+    labels = list(DISH_TABLE)
+    matrix = nutrient_matrix([per_serving(DISH_TABLE[label]) for label in labels])
+    return labels, matrix, evaluate(matrix)
+
+def acceptable_mask(verdicts: np.ndarray, conditions) -> np.ndarray:
+    """
+    True for rows that are "acceptable" for every one of the given conditions.
+    """
+    cols = [HEALTH_CONDITIONS.index(c) for c in conditions if c in HEALTH_CONDITIONS]
+    if not cols:
+        return np.ones(verdicts.shape[0], dtype=bool)
+    return (verdicts[:, cols] == 0).all(axis=1)
@@ -0,0 +1,177 @@
+import io
+import os
+from PIL import Image
+from starlette.concurrency import run_in_threadpool
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES") or 8 * 1024 * 1024)
+MAX_IMAGE_PIXELS = 40_000_000
+# The classifiers work on 224px crops; anything larger is only memory
+MAX_IMAGE_SIDE = 1024
+# Allowance for multipart boundaries and part headers on top of the file itself
+MULTIPART_OVERHEAD = 16 * 1024
+
+SNIFF_BYTES = 12
+
+class UploadRejected(Exception):
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+def sniff_image_format(head: bytes):
+    """
+    Returns the image format from the first bytes of a file, or None.
+    """
+    if head.startswith(b"\xff\xd8\xff"):
+        return "JPEG"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "PNG"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "GIF"
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        return "WEBP"
+    if head.startswith(b"BM"):
+        return "BMP"
+    return None
+
+class ImageIngest:
+    """
+    Receives an upload chunk by chunk: enforces the size limit, sniffs the
+    format from the first bytes and parses the image header as soon as it
+    has arrived, so a bad upload is rejected before the rest is read.
+    PIL cannot decode JPEG/PNG/WEBP incrementally, so the (size-limited)
+    body is buffered and decoded once in close(); JPEGs are decoded in draft
+    mode straight at roughly max_side instead of at full resolution.
+    """
+    def __init__(self, max_bytes=MAX_UPLOAD_BYTES, max_pixels=MAX_IMAGE_PIXELS, max_side=MAX_IMAGE_SIDE):
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.max_side = max_side
+        self.size = 0
+        self.format = None
+        self._buffer = io.BytesIO()
+        self._image = None
+
+    def _parse_header(self):
+        try:
+            image = Image.open(self._buffer)
+        except Image.DecompressionBombError as e:
+            raise UploadRejected(str(e), 413)
+        except Exception:
+            return  # header not complete yet
+        width, height = image.size
+        if width * height > self.max_pixels:
+            raise UploadRejected(f"Image is too large ({width}x{height})", 413)
+        # Lets libjpeg scale down by 1/2, 1/4 or 1/8 while decoding; no-op for other formats
+        image.draft("RGB", (self.max_side, self.max_side))
+        self._image = image
+
+    def feed(self, chunk: bytes):
+        if not chunk:
+            return
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise UploadRejected(f"Upload exceeds {self.max_bytes // (1024 * 1024)} MB limit", 413)
+
+        self._buffer.seek(0, io.SEEK_END)
+        self._buffer.write(chunk)
+        if self.format is None:
+            if self.size < SNIFF_BYTES:
+                return
+            self.format = sniff_image_format(self._buffer.getvalue()[:SNIFF_BYTES])
+            if self.format is None:
+                raise UploadRejected("Uploaded file is not a supported image (JPEG, PNG, GIF, WEBP, BMP)", 415)
+        if self._image is None:
+            self._parse_header()
+
+    def close(self) -> Image.Image:
+        """
+        Decodes the buffered upload and returns an RGB image no larger than
+        max_side. CPU-bound; read_image_upload runs it in the threadpool.
+        """
+        if self.format is None:
+            self.format = sniff_image_format(self._buffer.getvalue()[:SNIFF_BYTES])
+            if self.format is None:
+                raise UploadRejected("Uploaded file is not a supported image (JPEG, PNG, GIF, WEBP, BMP)", 415)
+        if self._image is None:
+            self._parse_header()
+            if self._image is None:
+                raise UploadRejected("Could not decode image: cannot identify image file", 400)
+        try:
+            image = self._image.convert("RGB")
+        except Exception as e:
+            raise UploadRejected(f"Could not decode image: {e}", 400)
+        image.thumbnail((self.max_side, self.max_side))
+        self._buffer = io.BytesIO()
+        return image
+
+async def read_image_upload(request, field_name="file"):
+    """
+    Streams a multipart/form-data request body into ImageIngest, rejecting
+    it as early as possible, then decodes the `field_name` part off the event loop.
+    Returns (filename, image); raises UploadRejected.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise UploadRejected("Expected a multipart/form-data upload", 415)
+
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD:
+        raise UploadRejected(f"Upload exceeds {MAX_UPLOAD_BYTES // (1024 * 1024)} MB limit", 413)
+
+    ingest = ImageIngest()
+    state = {"header_field": b"", "header_value": b"", "disposition": b"", "in_file": False, "found": False, "filename": None}
+
+    def on_part_begin():
+        state["disposition"] = b""
+
+    def on_header_field(data, start, end):
+        state["header_field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["header_value"] += data[start:end]
+
+    def on_header_end():
+        if state["header_field"].lower() == b"content-disposition":
+            state["disposition"] = state["header_value"]
+        state["header_field"] = b""
+        state["header_value"] = b""
+
+    def on_headers_finished():
+        _, options = parse_options_header(state["disposition"])
+        state["in_file"] = options.get(b"name") == field_name.encode() and not state["found"]
+        if state["in_file"]:
+            state["found"] = True
+            filename = options.get(b"filename")
+            state["filename"] = filename.decode("utf-8", "replace") if filename else None
+
+    def on_part_data(data, start, end):
+        if state["in_file"]:
+            ingest.feed(data[start:end])
+
+    def on_part_end():
+        state["in_file"] = False
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    received = 0
+    async for chunk in request.stream():
+        # Also covers chunked uploads that send no Content-Length
+        received += len(chunk)
+        if received > MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD:
+            raise UploadRejected(f"Upload exceeds {MAX_UPLOAD_BYTES // (1024 * 1024)} MB limit", 413)
+        parser.write(chunk)
+    parser.finalize()
+
+    if not state["found"]:
+        raise UploadRejected(f"No '{field_name}' file in upload", 400)
+    return state["filename"], await run_in_threadpool(ingest.close)
@@ -1,20 +1,30 @@
-from fastapi import FastAPI, UploadFile, File, Query
-from pydantic import BaseModel
+from fastapi import FastAPI, Query
+from pydantic import BaseModel, Field
+from typing import Optional
 from fastapi.middleware.cors import CORSMiddleware
 from model import predict_dish_ensemble
-from health_advice import get_health_verdict
+from health_advice import get_health_verdict, get_suitability, pick_substitute
 from chatbot import ask_nutribot
 from nutrition_combined_api import get_combined_nutrition
 from cohere_helper import get_dynamic_health_context
-from chatbot_prompt import get_chatbot_prompt
+from chatbot_prompt import get_chatbot_prompt, get_max_tokens, serialize_nutrition
+from meal_planner import build_meal_plan, format_meal_plan
+from admission import AdmissionController, Overloaded
+from image_ingest import read_image_upload, UploadRejected
+from substitutes import find_substitutes, find_substitutes_all
+from explain_jobs import submit_explanation, get_job, JobQueueFull
+from user_store import get_profile, save_profile, profile_prompt_fields, log_food, delete_log_entry, get_daily_summary, get_food_log
 import uvicorn
 import webbrowser
 import threading
+import tempfile
+import os
 from dotenv import load_dotenv
 
 # For the search_dish endpoint
 from fastapi import Request
 from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
 
 load_dotenv()
 
@@ -24,38 +34,130 @@ app = FastAPI(
     version="2.0"
 )
 
+# ---------------------- Admission Control ------------------------
+
+admission = AdmissionController()
+
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    # Runs before the endpoint reads the body, so shed uploads are never buffered
+    lane = admission.lane_for(request.url.path)
+    # CORS preflights are answered by CORSMiddleware and must not take a lane slot
+    if lane is None or request.method == "OPTIONS":
+        return await call_next(request)
+    try:
+        async with admission.admit(lane):
+            return await call_next(request)
+    except Overloaded as e:
+        print(f"🚦 Shed {request.url.path}: {e}")
+        return JSONResponse(
+            content={"error": str(e)},
+            status_code=e.status_code,
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+# Added after the admission middleware so CORS is the outer layer: shed 429/503
+# responses still carry the CORS headers browsers need to read them
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After"],
 )
 
-@app.post("/scan")
+@app.get("/admission")
+async def admission_stats():
+    return admission.stats()
+
+# ---------------------- Chatbot Explanations ------------------------
+
+async def get_explanation(chatbot_prompt, action, path, defer=True):
+    """
+    Returns (chatbot_explanation, explanation_job_id, degraded). Deferred
+    explanations come back as a job id to poll on /jobs/{job_id}.
+    """
+    if admission.is_saturated(path):
+        print(f"⏳ {path} saturated, skipping chatbot explanation")
+        return None, None, True
+    if defer:
+        try:
+            # Job store calls can block (the SQLite backend waits up to 10s on a locked database)
+            job_id = await run_in_threadpool(submit_explanation, chatbot_prompt, get_max_tokens(action))
+            return None, job_id, False
+        except JobQueueFull:
+            print("⏳ Explanation queue full, skipping chatbot explanation")
+            return None, None, True
+    return await run_in_threadpool(ask_nutribot, chatbot_prompt, get_max_tokens(action)), None, False
+
+def as_bool(value, default=True):
+    """
+    JSON body flags may arrive as strings ("false", "0", "no").
+    """
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value.strip().lower() not in ("false", "0", "no", "off", "")
+    return bool(value)
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = await run_in_threadpool(get_job, job_id)
+    if job is None:
+        return JSONResponse(content={"error": "Job not found or expired"}, status_code=404)
+    return job
+
+# ---------------------- Scan Endpoint ------------------------
+
+# The upload is streamed by read_image_upload, so the multipart body is documented here for Swagger
+SCAN_UPLOAD_SCHEMA = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"],
+                }
+            }
+        },
+    }
+}
+
+@app.post("/scan", openapi_extra=SCAN_UPLOAD_SCHEMA)
 async def scan_food(
-    file: UploadFile = File(...),
-    user_quantity_g: int = Query(100, description="Quantity in grams")
+    request: Request,
+    user_quantity_g: int = Query(100, description="Quantity in grams"),
+    user_id: Optional[str] = Query(None, description="Profile to personalise and log this scan for"),
+    defer_explanation: bool = Query(True, description="Return at once and generate the explanation as a job")
 ):
+    image_path = None
     try:
-        print(f"📸 Received file: {file.filename}")
+        # Size limit, format sniffing and decoding happen while the body streams in
+        filename, image = await read_image_upload(request)
+        print(f"📸 Received file: {filename} ({image.width}x{image.height})")
 
-        contents = await file.read()
-        with open("temp_image.jpg", "wb") as f:
-            f.write(contents)
+        # One temp file per request; concurrent scans must not overwrite each other's image
+        with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as f:
+            image.save(f, format="JPEG", quality=90)
+            image_path = f.name
 
         # 🔍 Model ensemble prediction
-        dish_name, model_used, confidence, model1_info, model2_info, hf_info = predict_dish_ensemble("temp_image.jpg", {})
+        # Blocking model/LLM calls run in the threadpool so the event loop keeps admitting and shedding
+        dish_name, model_used, confidence, model1_info, model2_info, hf_info = await run_in_threadpool(
+            predict_dish_ensemble, image_path, {}
+        )
         print(f"🍽️ Predicted Dish: {dish_name} ({model_used}, {confidence:.2f})")
 
     
         print("🧠 Using Cohere for nutrition and health context...")
         # Try Cohere first
-        dynamic_fields = get_dynamic_health_context(dish_name=dish_name)
+        dynamic_fields = await run_in_threadpool(get_dynamic_health_context, dish_name=dish_name)
         estimated_nutrition = dynamic_fields.get("estimated_nutrition", {})
         health_tags = dynamic_fields.get("health_tags", [])
-        suitability = dynamic_fields.get("suitability", {})
-        substitute = dynamic_fields.get("healthier_substitute", "N/A")
+        health_conditions, diet_preferences = await run_in_threadpool(profile_prompt_fields, user_id)
         source = dynamic_fields.get("source", "Cohere")
 
         if estimated_nutrition:
@@ -66,6 +168,13 @@ async def scan_food(
             base_nutrition = {}
             scaled_nutrition = {}
 
+        suitability = get_suitability(dish_name, {"per_100g": base_nutrition, "for_user_quantity": scaled_nutrition})
+        # Nearest healthier dish from the local index, computed once for the whole response;
+        # the LLM suggestion is the fallback
+        substitute = pick_substitute(
+            dish_name, suitability, health_conditions, default=dynamic_fields.get("healthier_substitute", "N/A")
+        )
+
         nutrition = {
             "per_100g": base_nutrition,
             "for_user_quantity": scaled_nutrition,
@@ -76,20 +185,24 @@ async def scan_food(
         }
 
         print("✅ Nutrition and health context fetched.")
-        health = get_health_verdict(dish_name, nutrition)
+        health = get_health_verdict(dish_name, nutrition, substitute=substitute)
+
+        log_entry_id = None
+        if user_id:
+            log_entry_id = await run_in_threadpool(log_food, user_id, dish_name, user_quantity_g, scaled_nutrition)
 
         # Prepare chatbot prompt for scan
         chatbot_prompt = get_chatbot_prompt(
             "scan",
             dish_name=dish_name,
-            nutrition_info=str(nutrition),
-            health_conditions=",".join(health.get("conditions", [])) if isinstance(health, dict) else "",
-            diet_preferences=""  # Fill from user profile if available
+            nutrition_info=serialize_nutrition(nutrition, quantity_g=user_quantity_g),
+            health_conditions=health_conditions,
+            diet_preferences=diet_preferences
         )
         print("🤖 Chatbot Prompt for Scan:\n", chatbot_prompt)
 
-        # Get chatbot reply (using your ask_nutribot function)
-        chatbot_reply = ask_nutribot(chatbot_prompt)
+        # Explanation is generated by a background job unless the client asks to wait for it
+        chatbot_reply, job_id, degraded = await get_explanation(chatbot_prompt, "scan", "/scan", defer_explanation)
 
         return {
             "dish": dish_name,
@@ -101,12 +214,21 @@ async def scan_food(
             "huggingface_prediction": {"dish": hf_info[0], "confidence": hf_info[1]},
             "nutrition": nutrition,
             "health_verdict": health,
-            "chatbot_explanation": chatbot_reply  # <-- Add this line
+            "log_entry_id": log_entry_id,
+            "chatbot_explanation": chatbot_reply,  # <-- Add this line
+            "explanation_job_id": job_id,
+            "degraded": degraded
         }
 
+    except UploadRejected as e:
+        print(f"🚫 Upload rejected: {e}")
+        return JSONResponse(content={"error": str(e)}, status_code=e.status_code)
     except Exception as e:
         print(f"❌ Error: {e}")
         return {"error": str(e)}
+    finally:
+        if image_path and os.path.exists(image_path):
+            os.remove(image_path)
 
 # ---------------------- Chatbot Endpoint ------------------------
 
@@ -116,7 +238,7 @@ class ChatRequest(BaseModel):
 @app.post("/chat")
 async def chatbot_query(request: ChatRequest):
     try:
-        reply = ask_nutribot(request.query)
+        reply = await run_in_threadpool(ask_nutribot, request.query, get_max_tokens("general"))
         return {"response": reply}
     except Exception as e:
         return {"error": str(e)}
@@ -129,14 +251,14 @@ async def search_dish(request: Request):
         data = await request.json()
         dish_name = data.get('dish_name')
         portion_size = data.get('portion_size', 100)
+        user_id = data.get('user_id')
 
         print("🧠 Using Cohere for nutrition and health context...")
         # Try Cohere first
-        dynamic_fields = get_dynamic_health_context(dish_name=dish_name)
+        dynamic_fields = await run_in_threadpool(get_dynamic_health_context, dish_name=dish_name)
         estimated_nutrition = dynamic_fields.get("estimated_nutrition", {})
         health_tags = dynamic_fields.get("health_tags", [])
-        suitability = dynamic_fields.get("suitability", {})
-        substitute = dynamic_fields.get("healthier_substitute", "N/A")
+        health_conditions, diet_preferences = await run_in_threadpool(profile_prompt_fields, user_id)
         source = dynamic_fields.get("source", "Cohere")
 
         if estimated_nutrition:
@@ -147,6 +269,13 @@ async def search_dish(request: Request):
             base_nutrition = {}
             scaled_nutrition = {}
 
+        suitability = get_suitability(dish_name, {"per_100g": base_nutrition, "for_user_quantity": scaled_nutrition})
+        # Nearest healthier dish from the local index, computed once for the whole response;
+        # the LLM suggestion is the fallback
+        substitute = pick_substitute(
+            dish_name, suitability, health_conditions, default=dynamic_fields.get("healthier_substitute", "N/A")
+        )
+
         result = {
             "dish": dish_name,
             "nutrition": {
@@ -163,21 +292,196 @@ async def search_dish(request: Request):
         chatbot_prompt = get_chatbot_prompt(
             "search",
             dish_name=dish_name,
-            nutrition_info=str(result["nutrition"]),
-            health_conditions="",  # Fill from user profile if available
-            diet_preferences=""
+            nutrition_info=serialize_nutrition(result["nutrition"], quantity_g=portion_size),
+            health_conditions=health_conditions,
+            diet_preferences=diet_preferences
         )
         print("🤖 Chatbot Prompt for Search:\n", chatbot_prompt)
 
-        # Get chatbot reply
-        chatbot_reply = ask_nutribot(chatbot_prompt)
+        # Get chatbot reply (deferred to a job by default)
+        chatbot_reply, job_id, degraded = await get_explanation(
+            chatbot_prompt, "search", "/api/search_dish", as_bool(data.get('defer_explanation'))
+        )
 
         result["chatbot_explanation"] = chatbot_reply  # Add to result
+        result["explanation_job_id"] = job_id
+        result["degraded"] = degraded
 
         return JSONResponse(content=result)
     except Exception as e:
         return JSONResponse(content={"error": str(e)}, status_code=500)
 
+# ---------------------- Barcode Endpoint ------------------------
+
+@app.get("/api/barcode")
+async def barcode_lookup(
+    code: str = Query(..., description="GTIN/UPC/EAN barcode"),
+    portion_size: int = Query(100, description="Quantity in grams")
+):
+    try:
+        # Resolved from the local FoodData Central index; remote USDA search is only the fallback
+        combined = await run_in_threadpool(get_combined_nutrition, barcode=code)
+        if combined.get("error") or not combined.get("nutrition"):
+            return JSONResponse(content={"error": f"No food found for barcode {code}"}, status_code=404)
+
+        base_nutrition = combined["nutrition"]["per_100g"]
+        scale_factor = portion_size / 100.0
+        scaled_nutrition = {k: round(v * scale_factor, 2) for k, v in base_nutrition.items()}
+        nutrition = {"per_100g": base_nutrition, "for_user_quantity": scaled_nutrition}
+        food_name = combined.get("dish") or code
+
+        return {
+            "barcode": code,
+            "food": food_name,
+            "brand": combined.get("brand"),
+            "quantity_grams": portion_size,
+            "nutrition": nutrition,
+            "health_verdict": get_health_verdict(food_name, nutrition),
+            "source": combined.get("model_used")
+        }
+    except Exception as e:
+        return JSONResponse(content={"error": str(e)}, status_code=500)
+
+# ---------------------- Substitutes Endpoints ------------------------
+
+@app.get("/api/substitutes")
+async def substitutes(
+    dish: str = Query(..., description="Dish name, e.g. butter chicken"),
+    health_conditions: str = Query("", description="Comma-separated, e.g. diabetes, high_BP"),
+    diet_preferences: str = Query("", description="e.g. halal, no fish"),
+    k: int = Query(3, ge=1, le=20),
+    user_id: Optional[str] = Query(None, description="Fills empty conditions/preferences from the profile")
+):
+    try:
+        profile_conditions, profile_preferences = await run_in_threadpool(profile_prompt_fields, user_id)
+        return {
+            "dish": dish,
+            "substitutes": find_substitutes(
+                dish,
+                health_conditions=health_conditions or profile_conditions,
+                diet_preferences=diet_preferences or profile_preferences,
+                k=k
+            ),
+            "source": "local"
+        }
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=404)
+    except Exception as e:
+        return JSONResponse(content={"error": str(e)}, status_code=500)
+
+@app.get("/api/substitutes/all")
+async def substitutes_all(
+    health_conditions: str = Query("", description="Comma-separated, e.g. diabetes, high_BP"),
+    diet_preferences: str = Query("", description="e.g. halal, no fish"),
+    k: int = Query(3, ge=1, le=20)
+):
+    try:
+        return find_substitutes_all(health_conditions=health_conditions, diet_preferences=diet_preferences, k=k)
+    except Exception as e:
+        return JSONResponse(content={"error": str(e)}, status_code=500)
+
+# ---------------------- Meal Plan Endpoint ------------------------
+
+class MealPlanRequest(BaseModel):
+    days: int = Field(3, ge=1, le=14)  # Each day rescans every combination, so keep plans to two weeks
+    calorie_limit: Optional[int] = None  # Defaults to the profile's limit, else 2000
+    diet_preferences: str = ""
+    health_conditions: str = ""
+    user_id: Optional[str] = None  # Fills empty fields from the stored profile
+    explain: bool = False  # Ask the chatbot to phrase the computed plan
+
+@app.post("/meal_plan")
+async def meal_plan(request: MealPlanRequest):
+    try:
+        profile = await run_in_threadpool(get_profile, request.user_id) or {}
+        calorie_limit = request.calorie_limit or profile.get("daily_calorie_limit") or 2000
+        diet_preferences = request.diet_preferences or profile.get("diet_preferences") or ""
+        health_conditions = request.health_conditions or profile.get("health_conditions") or ""
+
+        # The solver is CPU-bound numpy work; keep it off the event loop like the model/LLM calls
+        try:
+            result = await run_in_threadpool(
+                build_meal_plan,
+                days=request.days,
+                calorie_limit=calorie_limit,
+                diet_preferences=diet_preferences,
+                health_conditions=health_conditions
+            )
+        except ValueError as e:
+            # No plan fits the limit/preferences/conditions
+            return JSONResponse(content={"error": str(e)}, status_code=400)
+
+        if request.explain:
+            # The whole plan goes into the prompt; refuse rather than explain part of it
+            try:
+                chatbot_prompt = get_chatbot_prompt(
+                    "meal_plan_summary",
+                    plan_text=format_meal_plan(result),
+                    days=request.days,
+                    diet_preferences=diet_preferences,
+                    health_conditions=health_conditions
+                )
+            except ValueError as e:
+                return JSONResponse(content={"error": str(e)}, status_code=400)
+            result["chatbot_explanation"] = await run_in_threadpool(
+                ask_nutribot, chatbot_prompt, get_max_tokens("meal_plan_summary")
+            )
+
+        return result
+    except Exception as e:
+        return {"error": str(e)}
+
+# ---------------------- User Profile & Food Log Endpoints ------------------------
+
+class ProfileRequest(BaseModel):
+    name: Optional[str] = None
+    age: Optional[int] = None
+    health_conditions: Optional[str] = None  # Comma-separated, e.g. "diabetes, high_BP"
+    diet_preferences: Optional[str] = None
+    daily_calorie_limit: Optional[int] = None
+
+class FoodLogRequest(BaseModel):
+    dish: str
+    quantity_g: float = 100
+    nutrition: dict = {}  # Nutrients for the eaten quantity
+
+@app.put("/users/{user_id}/profile")
+async def update_profile(user_id: str, request: ProfileRequest):
+    try:
+        return await run_in_threadpool(save_profile, user_id, **request.model_dump())
+    except Exception as e:
+        return JSONResponse(content={"error": str(e)}, status_code=500)
+
+@app.get("/users/{user_id}/profile")
+async def read_profile(user_id: str):
+    profile = await run_in_threadpool(get_profile, user_id)
+    if profile is None:
+        return JSONResponse(content={"error": f"No profile for {user_id}"}, status_code=404)
+    return profile
+
+@app.post("/users/{user_id}/log")
+async def add_log_entry(user_id: str, request: FoodLogRequest):
+    try:
+        entry_id = await run_in_threadpool(log_food, user_id, request.dish, request.quantity_g, request.nutrition)
+        return {"log_entry_id": entry_id}
+    except Exception as e:
+        return JSONResponse(content={"error": str(e)}, status_code=500)
+
+@app.delete("/users/{user_id}/log/{entry_id}")
+async def remove_log_entry(user_id: str, entry_id: int):
+    deleted = await run_in_threadpool(delete_log_entry, user_id, entry_id)
+    if not deleted:
+        return JSONResponse(content={"error": "Log entry not found"}, status_code=404)
+    return {"deleted": entry_id}
+
+@app.get("/users/{user_id}/summary")
+async def daily_summary(user_id: str, day: Optional[str] = Query(None, description="YYYY-MM-DD, defaults to today")):
+    return await run_in_threadpool(get_daily_summary, user_id, day)
+
+@app.get("/users/{user_id}/log")
+async def food_log(user_id: str, day: Optional[str] = Query(None, description="YYYY-MM-DD, defaults to today")):
+    return await run_in_threadpool(get_food_log, user_id, day)
+
 # ---------------------- Auto-Open Swagger UI ------------------------
 
 def open_docs():
@@ -0,0 +1,134 @@
+import numpy as np
+from dish_nutrition import DISH_TABLE, display_name, per_serving
+from health_rules import parse_health_conditions, dish_table_matrix, acceptable_mask
+
+MEAL_SLOTS = ["breakfast", "lunch", "dinner", "snack"]
+
+PROTEIN_SOURCES = {"chicken", "egg", "fish", "mutton", "lamb", "pork", "beef", "duck", "vegetarian"}
+
+# Named diets -> protein sources they exclude
+DIET_EXCLUSIONS = {
+    "halal": {"pork"},
+    "no red meat": {"mutton", "lamb", "pork", "beef"},
+    "pescatarian": {"chicken", "mutton", "lamb", "pork", "beef", "duck"},
+    "eggetarian": {"chicken", "fish", "mutton", "lamb", "pork", "beef", "duck"},
+    "vegetarian": PROTEIN_SOURCES - {"vegetarian"},
+}
+
+# Score = protein (g) + CALORIE_WEIGHT * kcal - REPEAT_PENALTY * earlier uses of each dish
+CALORIE_WEIGHT = 0.02
+REPEAT_PENALTY = 50.0
+
+def _split(value):
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(",")
+    return [v.strip() for v in value if v and v.strip()]
+
+def parse_diet_preferences(diet_preferences):
+    """
+    Returns the set of protein sources excluded by the preferences,
+    e.g. "halal, no fish" -> {"pork", "fish"}.
+    """
+    excluded = set()
+    for raw in _split(diet_preferences):
+        pref = raw.lower().replace("_", " ")
+        if pref in DIET_EXCLUSIONS:
+            excluded |= DIET_EXCLUSIONS[pref]
+        elif pref.startswith("no "):
+            source = pref[3:].strip()
+            if source.endswith("s") and source[:-1] in PROTEIN_SOURCES:
+                source = source[:-1]
+            if source in PROTEIN_SOURCES:
+                excluded.add(source)
+            elif source in ("seafood", "meat"):
+                excluded |= {"fish"} if source == "seafood" else {"mutton", "lamb", "pork", "beef", "duck"}
+    return excluded
+
+def _candidates(conditions, excluded):
+    labels, matrix, verdicts = dish_table_matrix()
+    keep = acceptable_mask(verdicts, conditions)
+    keep &= np.array([DISH_TABLE[label]["protein_source"] not in excluded for label in labels])
+    picked = [label for label, k in zip(labels, keep) if k]
+    return picked, [per_serving(DISH_TABLE[label]) for label in picked]
+
+def build_meal_plan(days=3, calorie_limit=2000, diet_preferences="", health_conditions=""):
+    """
+    Picks breakfast, lunch, dinner and a snack for each day from the local
+    dish table. Every day stays under calorie_limit, every dish is rated
+    "acceptable" by health_rules for each condition, and dishes are rotated across days where possible.
+    Raises ValueError when no plan fits.
+    """
+    days = int(days)
+    calorie_limit = float(calorie_limit)
+    if days < 1:
+        raise ValueError("days must be at least 1")
+
+    conditions = parse_health_conditions(health_conditions)
+    excluded = parse_diet_preferences(diet_preferences)
+    labels, servings = _candidates(conditions, excluded)
+
+    calories = np.array([s["Calories"] for s in servings], dtype=float)
+    protein = np.array([s["Protein"] for s in servings], dtype=float)
+
+    slot_idx = []
+    for slot in MEAL_SLOTS:
+        idx = np.array([i for i, label in enumerate(labels) if slot in DISH_TABLE[label]["meals"]], dtype=int)
+        if idx.size == 0:
+            raise ValueError(f"No {slot} dish fits the given diet preferences and health conditions")
+        slot_idx.append(idx)
+
+    # Broadcast each slot along its own axis: (B, 1, 1, 1), (1, L, 1, 1), ...
+    axes = [idx.reshape([-1 if a == i else 1 for a in range(4)]) for i, idx in enumerate(slot_idx)]
+    total_calories = sum(calories[a] for a in axes)
+    valid = total_calories <= calorie_limit
+    for i in range(4):
+        for j in range(i + 1, 4):
+            valid &= axes[i] != axes[j]
+    if not valid.any():
+        raise ValueError(f"No combination of meals fits under {calorie_limit:g} calories per day")
+
+    uses = np.zeros(len(labels))
+    plan = []
+    for day in range(1, days + 1):
+        dish_score = protein + CALORIE_WEIGHT * calories - REPEAT_PENALTY * uses
+        score = np.where(valid, sum(dish_score[a] for a in axes), -np.inf)
+        best = np.unravel_index(np.argmax(score), score.shape)
+
+        meals = {}
+        for slot, idx, pos in zip(MEAL_SLOTS, slot_idx, best):
+            i = idx[pos]
+            uses[i] += 1
+            serving = servings[i]
+            meals[slot] = {
+                "dish": display_name(labels[i]),
+                "serving_g": DISH_TABLE[labels[i]]["serving_g"],
+                "nutrition": serving,
+            }
+        plan.append({
+            "day": day,
+            "meals": meals,
+            "total_calories": round(sum(m["nutrition"]["Calories"] for m in meals.values()), 2),
+            "total_protein": round(sum(m["nutrition"]["Protein"] for m in meals.values()), 2),
+        })
+
+    return {
+        "days": days,
+        "calorie_limit": calorie_limit,
+        "health_conditions": conditions,
+        "excluded_protein_sources": sorted(excluded),
+        "plan": plan,
+        "source": "local",
+    }
+
+def format_meal_plan(meal_plan: dict) -> str:
+    """
+    Bullet-point text of a computed plan, used when the LLM is asked to phrase it.
+    """
+    lines = []
+    for day in meal_plan["plan"]:
+        lines.append(f"Day {day['day']} ({day['total_calories']:g} kcal):")
+        for slot, meal in day["meals"].items():
+            lines.append(f"- {slot.capitalize()}: {meal['dish']}, {meal['serving_g']}g, {meal['nutrition']['Calories']:g} kcal")
+    return "\n".join(lines)
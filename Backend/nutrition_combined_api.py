@@ -1,6 +1,10 @@
 # nutrition_combined_api.py (UPDATED WITH MERGING & DYNAMIC)
 import requests
 import os
+from health_rules import evaluate_suitability
+from fdc_index import lookup_dish, lookup_barcode
+from dish_nutrition import NUTRIENT_KEYS
+from substitutes import best_substitute
 
 # Replace with real keys or use dotenv in deployment
 SPOONACULAR_API_KEY = os.getenv("SPOONACULAR_API_KEY") or "3f63514bf7c645e88a0a765185923a7a"
@@ -42,15 +46,6 @@ def try_edamam(dish_name):
             protein = data["totalNutrients"].get("PROCNT", {}).get("quantity", 0)
             carbs = data["totalNutrients"].get("CHOCDF", {}).get("quantity", 0)
 
-            suitability = {
-                "diabetes": "avoid" if sugar > 15 or carbs > 50 else "acceptable",
-                "high_BP": "not recommended" if sodium > 800 else "acceptable",
-                "heart_disease": "caution" if fat > 30 else "acceptable",
-                "high_cholesterol": "not recommended" if fat > 25 else "acceptable",
-                "low_BP": "acceptable",
-                "kidney": "caution"
-            }
-
             nutrients = {
                 "Calories": data.get("calories", 0),
                 "Protein": protein,
@@ -63,12 +58,13 @@ def try_edamam(dish_name):
                 "Cholesterol": data["totalNutrients"].get("CHOLE", {}).get("quantity", 0),
                 "Sodium": sodium
             }
+            suitability = evaluate_suitability(nutrients)
 
             return {
                 "full_nutrients": nutrients,
                 "health_tags": data.get("healthLabels", []),
                 "suitability": suitability,
-                "healthier_substitute": "Use less oil/salt and prefer grilled version",
+                "healthier_substitute": best_substitute(dish_name, default="Use less oil/salt and prefer grilled version"),
                 "source": "Edamam"
             }
     except:
@@ -120,7 +116,24 @@ def get_combined_nutrition(dish_name=None, barcode=None):
         "health_verdict": None,
     }
 
-    # First try Edamam for full data
+    # Local index first: barcode or dish name resolve without any HTTP round trip
+    if barcode or dish_name:
+        try:
+            food = lookup_barcode(barcode) if barcode else lookup_dish(dish_name)
+        except Exception as e:
+            print(f"❌ Local USDA index error: {e}")
+            food = None
+        if food:
+            per_100g = {k: food[k] for k in NUTRIENT_KEYS if k in food}
+            result["dish"] = dish_name or food["description"]
+            if barcode:
+                result["brand"] = food["brand"]
+            result["nutrition"] = {"per_100g": per_100g}
+            result["health_verdict"] = {"suitability": evaluate_suitability(per_100g)}
+            result["model_used"] = "usda_local"
+            return result
+
+    # Then try Edamam for full data
     if dish_name:
         edamam = try_edamam(dish_name)
         if edamam:
@@ -147,7 +160,7 @@ def get_combined_nutrition(dish_name=None, barcode=None):
                 "source": "Spoonacular"
             }
 
-    # Finally USDA if others fail
+    # Finally the remote USDA API if others fail (the local index was already checked above)
     search_term = barcode or dish_name
     if search_term:
         usda = try_usda(search_term)
@@ -0,0 +1,119 @@
+import numpy as np
+from dish_nutrition import DISH_TABLE, NUTRIENT_KEYS, find_dish, display_name
+from health_rules import nutrient_vector, evaluate, dish_table_matrix, acceptable_mask, parse_health_conditions, HEALTH_CONDITIONS
+from meal_planner import parse_diet_preferences
+
+# ---------------------- Neighbour Index ------------------------
+# With one row per known dish (67), an exact all-pairs table is the cheapest index:
+# every query is a row lookup plus a mask, and the whole label set is one matrix op.
+
+LABELS = list(DISH_TABLE)
+_POS = {label: i for i, label in enumerate(LABELS)}
+
+_RAW = np.array([[DISH_TABLE[label]["per_100g"][k] for k in NUTRIENT_KEYS] for label in LABELS], dtype=float)
+_MEAN = _RAW.mean(axis=0)
+_STD = _RAW.std(axis=0)
+_STD[_STD == 0] = 1.0
+FEATURES = (_RAW - _MEAN) / _STD
+
+DISTANCES = np.sqrt(((FEATURES[:, None, :] - FEATURES[None, :, :]) ** 2).sum(axis=2))
+np.fill_diagonal(DISTANCES, np.inf)
+NEIGHBOURS = np.argsort(DISTANCES, axis=1)
+
+_CALORIES = _RAW[:, NUTRIENT_KEYS.index("Calories")]
+_SOURCES = np.array([DISH_TABLE[label]["protein_source"] for label in LABELS])
+# Lookup-only entries (no meal slots) are never suggested
+_SUGGESTABLE = np.array([bool(DISH_TABLE[label]["meals"]) for label in LABELS])
+# Per-100g verdicts, to compare raw nutrition (which has no serving size) on the same basis
+_VERDICTS_100G = evaluate(_RAW)
+
+def _parse_conditions(health_conditions):
+    # Unknown conditions ("asthma") have no rules, so they must not count as given
+    return [c for c in parse_health_conditions(health_conditions) if c in HEALTH_CONDITIONS]
+
+def _candidate_mask(conditions, excluded):
+    """
+    Dishes allowed for the user: real dishes that are "acceptable" for every
+    given condition and not made from an excluded protein source.
+    """
+    _, _, verdicts = dish_table_matrix()
+    mask = acceptable_mask(verdicts, conditions) & _SUGGESTABLE
+    if excluded:
+        mask &= ~np.isin(_SOURCES, list(excluded))
+    return mask
+
+def _healthier_mask(i):
+    """
+    "Healthier" means no worse on any condition and fewer calories per 100g.
+    """
+    _, _, verdicts = dish_table_matrix()
+    return (verdicts <= verdicts[i]).all(axis=1) & (_CALORIES < _CALORIES[i])
+
+def _to_items(indices, distances):
+    return [
+        {
+            "dish": display_name(LABELS[j]),
+            "distance": round(float(d), 3),
+            "per_100g": DISH_TABLE[LABELS[j]]["per_100g"],
+        }
+        for j, d in zip(indices, distances)
+    ]
+
+def find_substitutes(dish_name=None, health_conditions="", diet_preferences="", k=3, nutrition=None):
+    """
+    The k dishes closest in nutrient profile to dish_name (or to a raw
+    per-100g nutrition dict for dishes outside the table) that pass the
+    condition and diet filters. Raises ValueError for an unknown dish
+    without nutrition.
+    """
+    conditions = _parse_conditions(health_conditions)
+    excluded = parse_diet_preferences(diet_preferences)
+    # Always a healthier dish; the user's conditions and diet narrow it further
+    mask = _candidate_mask(conditions, excluded)
+
+    label, _ = find_dish(dish_name) if dish_name else (None, None)
+    if label is not None:
+        i = _POS[label]
+        mask = mask & _healthier_mask(i)
+        order = NEIGHBOURS[i]
+        order = order[mask[order]][:k]
+        return _to_items(order, DISTANCES[i, order])
+
+    if not nutrition:
+        raise ValueError(f"Unknown dish '{dish_name}'; pass its nutrition to find substitutes")
+    vec = nutrient_vector(nutrition)
+    vec = np.where(np.isnan(vec), _MEAN, vec)
+    distances = np.sqrt((((vec - _MEAN) / _STD - FEATURES) ** 2).sum(axis=1))
+    no_worse = (_VERDICTS_100G <= evaluate(vec)[0]).all(axis=1)
+    mask = mask & no_worse & (_CALORIES < vec[NUTRIENT_KEYS.index("Calories")])
+    order = np.argsort(distances)
+    order = order[mask[order]][:k]
+    return _to_items(order, distances[order])
+
+def find_substitutes_all(health_conditions="", diet_preferences="", k=3):
+    """
+    Substitutes for every dish in the label set at once: {dish: [substitutes]}.
+    """
+    conditions = _parse_conditions(health_conditions)
+    mask = _candidate_mask(conditions, parse_diet_preferences(diet_preferences))
+    # Same rule as find_substitutes: healthier than the row's dish, then the user's filters
+    _, _, verdicts = dish_table_matrix()
+    no_worse = (verdicts[None, :, :] <= verdicts[:, None, :]).all(axis=2)
+    allowed = mask[None, :] & no_worse & (_CALORIES[None, :] < _CALORIES[:, None])
+    distances = np.where(allowed, DISTANCES, np.inf)
+    top = np.argsort(distances, axis=1)[:, :k]
+    result = {}
+    for i, row in enumerate(top):
+        row = row[np.isfinite(distances[i, row])]
+        result[display_name(LABELS[i])] = _to_items(row, distances[i, row])
+    return result
+
+def best_substitute(dish_name, health_conditions="", default=None):
+    """
+    Name of the closest healthier dish, or default when none is known.
+    """
+    try:
+        items = find_substitutes(dish_name, health_conditions, k=1)
+    except ValueError:
+        return default
+    return items[0]["dish"] if items else default
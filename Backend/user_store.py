@@ -0,0 +1,195 @@
+import os
+import math
+import sqlite3
+import time
+import threading
+from datetime import datetime
+from dish_nutrition import NUTRIENT_KEYS
+from health_rules import nutrient_vector
+
+DB_PATH = os.getenv("EATRIGHT_DB_PATH") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "eatright.db")
+
+PROFILE_FIELDS = ["name", "age", "health_conditions", "diet_preferences", "daily_calorie_limit"]
+
+# food_log and daily_totals share one column per nutrient
+_COLUMNS = [k.lower() for k in NUTRIENT_KEYS]
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS profiles (
+    user_id TEXT PRIMARY KEY,
+    name TEXT,
+    age INTEGER,
+    health_conditions TEXT NOT NULL DEFAULT '',
+    diet_preferences TEXT NOT NULL DEFAULT '',
+    daily_calorie_limit INTEGER,
+    updated_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS food_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    logged_at TEXT NOT NULL,
+    dish TEXT NOT NULL,
+    quantity_g REAL NOT NULL,
+    {", ".join(f"{c} REAL NOT NULL DEFAULT 0" for c in _COLUMNS)}
+);
+CREATE INDEX IF NOT EXISTS food_log_user_day ON food_log (user_id, day);
+
+CREATE TABLE IF NOT EXISTS daily_totals (
+    user_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    entries INTEGER NOT NULL DEFAULT 0,
+    {", ".join(f"{c} REAL NOT NULL DEFAULT 0" for c in _COLUMNS)},
+    PRIMARY KEY (user_id, day)
+) WITHOUT ROWID;
+
+-- Running per-day totals: each insert/delete adjusts one row instead of re-summing the log
+CREATE TRIGGER IF NOT EXISTS food_log_insert AFTER INSERT ON food_log BEGIN
+    INSERT INTO daily_totals (user_id, day, entries, {", ".join(_COLUMNS)})
+    VALUES (NEW.user_id, NEW.day, 1, {", ".join(f"NEW.{c}" for c in _COLUMNS)})
+    ON CONFLICT (user_id, day) DO UPDATE SET
+        entries = entries + 1,
+        {", ".join(f"{c} = {c} + excluded.{c}" for c in _COLUMNS)};
+END;
+
+CREATE TRIGGER IF NOT EXISTS food_log_delete AFTER DELETE ON food_log BEGIN
+    UPDATE daily_totals SET
+        entries = entries - 1,
+        {", ".join(f"{c} = {c} - OLD.{c}" for c in _COLUMNS)}
+    WHERE user_id = OLD.user_id AND day = OLD.day;
+END;
+"""
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = set()
+
+# Profiles are read on every /scan and search; keep them in process, write-through on save.
+# Entries expire after PROFILE_CACHE_TTL seconds so updates saved by other workers show up.
+PROFILE_CACHE_TTL = int(os.getenv("PROFILE_CACHE_TTL") or 30)
+_profile_cache = {}  # user_id -> (profile, expires_at)
+_profile_lock = threading.Lock()
+
+def _connect():
+    """
+    One connection per thread (endpoints run blocking work in the threadpool).
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.path == DB_PATH:
+        return conn
+    conn = sqlite3.connect(DB_PATH, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    with _init_lock:
+        if DB_PATH not in _initialized:
+            conn.executescript(SCHEMA)
+            _initialized.add(DB_PATH)
+    _local.conn, _local.path = conn, DB_PATH
+    return conn
+
+def get_profile(user_id: str):
+    """
+    Returns the cached profile dict, loading it from the database on first use.
+    Misses are not cached and hits expire after PROFILE_CACHE_TTL: ids are
+    client-supplied, and another worker may create or update the profile.
+    """
+    if not user_id:
+        return None
+    now = time.monotonic()
+    with _profile_lock:
+        cached = _profile_cache.get(user_id)
+    if cached is not None and cached[1] > now:
+        return cached[0]
+    row = _connect().execute("SELECT * FROM profiles WHERE user_id = ?", (user_id,)).fetchone()
+    if row is None:
+        with _profile_lock:
+            _profile_cache.pop(user_id, None)
+        return None
+    profile = dict(row)
+    with _profile_lock:
+        _profile_cache[user_id] = (profile, now + PROFILE_CACHE_TTL)
+    return profile
+
+def save_profile(user_id: str, **fields) -> dict:
+    """
+    Creates or updates a profile; fields not passed keep their stored value.
+    """
+    current = get_profile(user_id) or {}
+    profile = {"user_id": user_id}
+    for field in PROFILE_FIELDS:
+        value = fields.get(field)
+        profile[field] = value if value is not None else current.get(field)
+    for field in ("health_conditions", "diet_preferences"):
+        value = profile[field] or ""
+        profile[field] = ", ".join(value) if isinstance(value, list) else value
+    profile["updated_at"] = datetime.now().isoformat(timespec="seconds")
+
+    conn = _connect()
+    with conn:
+        conn.execute(
+            f"INSERT OR REPLACE INTO profiles (user_id, {', '.join(PROFILE_FIELDS)}, updated_at) "
+            f"VALUES (?, {', '.join('?' for _ in PROFILE_FIELDS)}, ?)",
+            [user_id] + [profile[f] for f in PROFILE_FIELDS] + [profile["updated_at"]]
+        )
+    with _profile_lock:
+        _profile_cache[user_id] = (profile, time.monotonic() + PROFILE_CACHE_TTL)
+    return profile
+
+def profile_prompt_fields(user_id: str):
+    """
+    (health_conditions, diet_preferences) strings for the prompt builders; empty without a profile.
+    """
+    profile = get_profile(user_id) or {}
+    return profile.get("health_conditions") or "", profile.get("diet_preferences") or ""
+
+def log_food(user_id: str, dish: str, quantity_g: float, nutrition: dict, logged_at: datetime = None) -> int:
+    """
+    Records what the user ate; nutrition is for the eaten quantity. The
+    food_log_insert trigger adds it to that day's totals in the same transaction.
+    """
+    logged_at = logged_at or datetime.now()
+    values = [0.0 if math.isnan(v) else float(v) for v in nutrient_vector(nutrition)]
+    conn = _connect()
+    with conn:
+        cur = conn.execute(
+            f"INSERT INTO food_log (user_id, day, logged_at, dish, quantity_g, {', '.join(_COLUMNS)}) "
+            f"VALUES (?, ?, ?, ?, ?, {', '.join('?' for _ in _COLUMNS)})",
+            [user_id, logged_at.date().isoformat(), logged_at.isoformat(timespec="seconds"), dish, quantity_g] + values
+        )
+    return cur.lastrowid
+
+def delete_log_entry(user_id: str, entry_id: int) -> bool:
+    conn = _connect()
+    with conn:
+        cur = conn.execute("DELETE FROM food_log WHERE id = ? AND user_id = ?", (entry_id, user_id))
+    return cur.rowcount > 0
+
+def get_daily_summary(user_id: str, day: str = None) -> dict:
+    """
+    Totals for one day, read from the single daily_totals row.
+    """
+    day = day or datetime.now().date().isoformat()
+    row = _connect().execute(
+        "SELECT * FROM daily_totals WHERE user_id = ? AND day = ?", (user_id, day)
+    ).fetchone()
+    totals = {key: round(row[col], 2) if row else 0 for key, col in zip(NUTRIENT_KEYS, _COLUMNS)}
+    summary = {
+        "user_id": user_id,
+        "day": day,
+        "entries": row["entries"] if row else 0,
+        "totals": totals,
+    }
+    limit = (get_profile(user_id) or {}).get("daily_calorie_limit")
+    if limit:
+        summary["calorie_limit"] = limit
+        summary["calories_remaining"] = round(limit - totals["Calories"], 2)
+    return summary
+
+def get_food_log(user_id: str, day: str = None) -> list:
+    day = day or datetime.now().date().isoformat()
+    rows = _connect().execute(
+        "SELECT * FROM food_log WHERE user_id = ? AND day = ? ORDER BY id", (user_id, day)
+    ).fetchall()
+    return [dict(row) for row in rows]